@@ -13,7 +13,11 @@ from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.common.exceptions import TimeoutException
 from bs4 import BeautifulSoup
-from database import product_collection, order_collection
+from database import product_collection, order_collection, department_rules_collection, price_bands_collection
+from classifier import DepartmentClassifier
+from events import publish_event
+from scheduler import scheduled_get, raise_if_cancelled, FetchCancelled
+from response_cache import bump_collection_version
 
 # Load environment variables
 load_dotenv()
@@ -27,6 +31,9 @@ AMAZON_CVV = os.getenv("AMAZON_CVV")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keyword and price band rules, compiled once and reloaded when they change in MongoDB
+department_classifier = DepartmentClassifier(department_rules_collection, price_bands_collection)
+
 def get_department_id(query):
     """
     Map common products to their department IDs.
@@ -37,19 +44,7 @@ def get_department_id(query):
     Returns:
         str: Department identifier
     """
-    product_departments = {
-        'iphone': 'electronics',
-        'samsung': 'electronics',
-        'macbook': 'computers',
-        'laptop': 'computers',
-        'ipad': 'electronics',
-    }
-    
-    query_lower = query.lower()
-    for key, department in product_departments.items():
-        if key in query_lower:
-            return department
-    return 'all'
+    return department_classifier.classify(query)
 
 def create_driver(headless=True):
     """
@@ -60,7 +55,13 @@ def create_driver(headless=True):
     
     Returns:
         webdriver.Chrome: Configured Chrome WebDriver
+    
+    Raises:
+        FetchCancelled: If the current request was cancelled
     """
+    # Don't start a browser for a client that has already gone away
+    raise_if_cancelled()
+    
     options = Options()
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
@@ -87,7 +88,7 @@ def get_soup(url, driver):
         BeautifulSoup: Parsed webpage or None
     """
     try:
-        driver.get(url)
+        scheduled_get(driver, url)
         time.sleep(5)
         page_source = driver.page_source
         
@@ -99,6 +100,8 @@ def get_soup(url, driver):
     except TimeoutException:
         logger.error("Timeout occurred while loading the page.")
         return None
+    except FetchCancelled:
+        raise
     except Exception as e:
         logger.error(f"Error fetching page: {e}")
         return None
@@ -111,6 +114,9 @@ def save_to_db(collection, data, key):
         collection: MongoDB collection
         data (dict): Data to save
         key (str): Unique identifier key
+    
+    Returns:
+        bool: True if the write succeeded
     """
     try:
         existing_record = collection.find_one({key: data[key]})
@@ -118,8 +124,11 @@ def save_to_db(collection, data, key):
             collection.update_one({key: data[key]}, {"$set": data})
         else:
             collection.insert_one(data)
+        bump_collection_version(collection)
+        return True
     except Exception as e:
         logger.error(f"Error saving to database: {e}")
+        return False
 
 def extract_product_details(item):
     """
@@ -254,7 +263,7 @@ def navigate_to_orders_and_get_details(driver):
         dict: Order details including delivery date for delivered orders
     """
     try:
-        driver.get("https://www.amazon.in")
+        scheduled_get(driver, "https://www.amazon.in")
         time.sleep(3)
         
         orders_link = WebDriverWait(driver, 20).until(
@@ -266,7 +275,7 @@ def navigate_to_orders_and_get_details(driver):
             if not amazon_login(driver):
                 raise Exception("Login failed while checking order status")
             
-            driver.get("https://www.amazon.in/gp/your-account/order-history")
+            scheduled_get(driver, "https://www.amazon.in/gp/your-account/order-history")
         
         order_id = WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.CLASS_NAME, "yohtmlc-order-id"))
@@ -315,13 +324,26 @@ def navigate_to_orders_and_get_details(driver):
         
         # Only save to database if status is "Delivered"
         if main_status == "Delivered":
-            save_to_db(order_collection, order_data, "order_id")
-            order_data['saved_to_db'] = True
+            newly_delivered = order_collection.find_one({"order_id": order_id}) is None
+            if newly_delivered:
+                # Freeze what was paid; later scrapes overwrite the product's current price
+                purchased = product_collection.find_one({"title": title}, {"last_purchase_price": 1})
+                order_data['purchase_price'] = purchased.get("last_purchase_price") if purchased else None
+            order_data['saved_to_db'] = save_to_db(order_collection, order_data, "order_id")
+            # Only announce confirmed writes, otherwise the next run would announce it again
+            if newly_delivered and order_data['saved_to_db']:
+                publish_event("order_delivered", {
+                    "order_id": order_id,
+                    "product_title": title,
+                    "delivery_date": delivery_date
+                })
         else:
             order_data['saved_to_db'] = False
         
         return order_data
         
+    except FetchCancelled:
+        raise
     except Exception as e:
         logger.error(f"Error checking order status: {str(e)}")
         return {
@@ -344,7 +366,7 @@ def login_amazon_and_continue(product_url):
     """
     driver = create_driver(headless=False)
     try:
-        driver.get(product_url)
+        scheduled_get(driver, product_url)
         time.sleep(3)
         
         buy_now_button = WebDriverWait(driver, 30).until(
@@ -363,12 +385,36 @@ def login_amazon_and_continue(product_url):
         # order_details = navigate_to_orders_and_get_details(driver)
         
         return payment_success
+    except FetchCancelled:
+        raise
     except Exception as e:
         logger.error(f"🚨 Unexpected error: {e}")
         return False, {"success": False, "error": str(e)}
     finally:
         driver.quit()
 
+def record_purchase_price(product):
+    """
+    Remember the price paid for a product after a successful checkout.
+    
+    Copied onto the order when it is first saved as delivered, so resale
+    margins use the checkout price rather than the latest scraped one.
+    
+    Args:
+        product (dict): Purchased product details
+    """
+    try:
+        product_collection.update_one(
+            {"title": product["title"]},
+            {"$set": {
+                "last_purchase_price": product["numerical_price"],
+                "last_purchased_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }}
+        )
+        bump_collection_version(product_collection)
+    except Exception as e:
+        logger.error(f"Error recording purchase price: {e}")
+
 def find_lowest_price_item(items, department):
     """
     Find lowest-priced item matching department criteria.
@@ -464,7 +510,15 @@ def find_lowest_price_item(items, department):
     
     # Save lowest price item to database
     if lowest_price_details:
-        save_to_db(product_collection, lowest_price_details, "title")
+        saved = save_to_db(product_collection, lowest_price_details, "title")
+        # Only announce confirmed writes, otherwise the next scrape would announce it again
+        if saved and "price_drop" in lowest_price_details:
+            publish_event("price_drop", {
+                "title": lowest_price_details["title"],
+                "link": lowest_price_details["link"],
+                "price": lowest_price_details["numerical_price"],
+                **lowest_price_details["price_drop"]
+            })
     
     return lowest_price_item
 
@@ -479,11 +533,7 @@ def is_valid_price(price, department):
     Returns:
         bool: Price validity status
     """
-    if department == 'electronics' and price < 5000:
-        return False
-    if department == 'computers' and price < 20000:
-        return False
-    return True
+    return department_classifier.is_valid_price(price, department)
 def update_stock_status(product):
     """
     Update product stock availability.
@@ -508,6 +558,24 @@ def update_stock_status(product):
         else:
             product["stock_status"] = "Low Stock" if max_quantity <= 5 else "Available" if max_quantity > 0 else "Out of Stock"
             product["stock_quantity"] = max_quantity
+        
+        # Persist the status and only notify subscribers when it changed
+        try:
+            previous = product_collection.find_one_and_update(
+                {"title": product["title"]},
+                {"$set": {"stock_status": product["stock_status"], "stock_quantity": product["stock_quantity"]}}
+            )
+            bump_collection_version(product_collection)
+        except Exception as e:
+            logger.error(f"Error saving stock status: {e}")
+            return
+        if previous is None or previous.get("stock_status") != product["stock_status"]:
+            publish_event("stock_status", {
+                "title": product["title"],
+                "link": product["link"],
+                "stock_status": product["stock_status"],
+                "stock_quantity": product["stock_quantity"]
+            })
     finally:
         driver.quit()
 
@@ -0,0 +1,302 @@
+import logging
+import threading
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+
+logger = logging.getLogger(__name__)
+
+# Serializes full rebuilds with sale inserts and their incremental updates.
+# Sufficient because gunicorn.conf.py runs a single worker process.
+_analytics_lock = threading.Lock()
+
+MS_PER_DAY = 1000 * 60 * 60 * 24
+
+# Numeric selling price; sales recorded before selling_price_value existed
+# fall back to converting the raw selling_price (plain numbers only)
+SELLING_PRICE_EXPR = {"$ifNull": [
+    "$selling_price_value",
+    {"$convert": {"input": "$selling_price", "to": "double", "onError": None, "onNull": None}}
+]}
+
+# Summable fields of the materialized per-product documents
+TOTAL_FIELDS = ("sold_count", "revenue", "cost", "margin", "priced_count",
+                "turnover_days_total", "turnover_count")
+
+def ensure_indexes(product_collection, order_collection, sold_products_collection):
+    """
+    Create the indexes used by the analytics joins.
+
+    Args:
+        product_collection: MongoDB products collection
+        order_collection: MongoDB orders collection
+        sold_products_collection: MongoDB sold_products collection
+    """
+    try:
+        product_collection.create_index([("title", ASCENDING)])
+        order_collection.create_index([("order_id", ASCENDING)])
+        sold_products_collection.create_index([("order_id", ASCENDING)])
+    except Exception as e:
+        logger.error(f"Error creating analytics indexes: {e}")
+
+def to_float(value):
+    """
+    Convert a stored price to float.
+
+    Args:
+        value: Price as number or string (e.g. "1,299.00")
+
+    Returns:
+        float or None: Numeric price, None if not convertible
+    """
+    try:
+        return float(str(value).replace(",", "").replace("₹", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+def parse_sold_date(sold_date):
+    """
+    Parse the sold date sent to /sell_product.
+
+    Args:
+        sold_date (str): Date as YYYY-MM-DD, or "Not specified"
+
+    Returns:
+        datetime: Parsed date, or now if it cannot be parsed
+    """
+    for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d %B %Y"):
+        try:
+            return datetime.strptime(str(sold_date), fmt)
+        except ValueError:
+            continue
+    return datetime.now()
+
+def parse_delivery_date(delivery_date, reference):
+    """
+    Parse a scraped delivery date such as "31 January".
+
+    The order page omits the year, so the latest matching date not after
+    the reference date is used.
+
+    Args:
+        delivery_date (str): Delivery date text
+        reference (datetime): Date the product was sold
+
+    Returns:
+        datetime or None: Parsed delivery date
+    """
+    for fmt in ("%d %B", "%d %b", "%A, %d %B", "%A %d %B"):
+        try:
+            parsed = datetime.strptime(str(delivery_date).strip(), fmt)
+        except ValueError:
+            continue
+        parsed = parsed.replace(year=reference.year)
+        if parsed > reference:
+            parsed = parsed.replace(year=reference.year - 1)
+        return parsed
+    return None
+
+def sale_metrics_stages(order_collection_name):
+    """
+    Pipeline stages that turn sold_products documents into per-sale metrics.
+
+    Revenue is the numeric selling_price_value stored by /sell_product, or
+    the converted selling_price for older sales. Cost is the purchase price
+    copied onto the sale, falling back to the one recorded on the joined
+    order; sales without either are left unpriced.
+
+    Args:
+        order_collection_name (str): Name of the orders collection
+
+    Returns:
+        list: Aggregation stages
+    """
+    return [
+        {"$lookup": {
+            "from": order_collection_name,
+            "localField": "order_id",
+            "foreignField": "order_id",
+            "as": "order"
+        }},
+        {"$addFields": {
+            "title": {"$ifNull": [{"$first": "$order.product_title"}, "$product_title"]}
+        }},
+        {"$addFields": {
+            "revenue": SELLING_PRICE_EXPR,
+            "cost": {"$ifNull": ["$purchase_price", {"$first": "$order.purchase_price"}]},
+            "turnover_days": {"$cond": [
+                {"$and": [{"$eq": [{"$type": "$sold_at"}, "date"]}, {"$eq": [{"$type": "$delivered_at"}, "date"]}]},
+                {"$divide": [{"$subtract": ["$sold_at", "$delivered_at"]}, MS_PER_DAY]},
+                None
+            ]}
+        }},
+        {"$addFields": {
+            "margin": {"$cond": [
+                {"$and": [{"$isNumber": "$revenue"}, {"$isNumber": "$cost"}]},
+                {"$subtract": ["$revenue", "$cost"]},
+                None
+            ]}
+        }},
+    ]
+
+def profit_by_product_stages():
+    """Pipeline stages grouping per-sale metrics by product title."""
+    return [
+        {"$group": {
+            "_id": "$title",
+            "sold_count": {"$sum": 1},
+            "revenue": {"$sum": "$revenue"},
+            "cost": {"$sum": {"$cond": [{"$isNumber": "$margin"}, "$cost", 0]}},
+            "margin": {"$sum": "$margin"},
+            "priced_count": {"$sum": {"$cond": [{"$isNumber": "$margin"}, 1, 0]}},
+            "turnover_days_total": {"$sum": "$turnover_days"},
+            "turnover_count": {"$sum": {"$cond": [{"$isNumber": "$turnover_days"}, 1, 0]}}
+        }},
+    ]
+
+def rebuild_resale_analytics(sold_products_collection, order_collection, analytics_collection):
+    """
+    Recompute the materialized per-product profit collection from scratch.
+
+    Args:
+        sold_products_collection: MongoDB sold_products collection
+        order_collection: MongoDB orders collection
+        analytics_collection: Collection holding the materialized results
+    """
+    pipeline = (
+        sale_metrics_stages(order_collection.name)
+        + profit_by_product_stages()
+        + [{"$out": analytics_collection.name}]
+    )
+    # A sale inserted between the pipeline's read and the $out swap would
+    # otherwise have its $inc applied to the collection being replaced
+    with _analytics_lock:
+        sold_products_collection.aggregate(pipeline)
+    logger.info("Resale analytics rebuilt")
+
+def insert_sale(sold_products_collection, analytics_collection, sold_product):
+    """
+    Insert a sale and apply it to the materialized results.
+
+    Both steps run under the rebuild lock, so a concurrent rebuild either
+    includes the sale or runs before it and sees the $inc afterwards.
+
+    Args:
+        sold_products_collection: MongoDB sold_products collection
+        analytics_collection: Collection holding the materialized results
+        sold_product (dict): sold_products document to insert
+    """
+    with _analytics_lock:
+        sold_products_collection.insert_one(sold_product)
+        record_sale_in_analytics(analytics_collection, sold_product)
+
+def record_sale_in_analytics(analytics_collection, sold_product):
+    """
+    Incrementally apply a new sale to the materialized results.
+
+    Skipped until the first rebuild, which will include this sale anyway.
+    Callers must hold _analytics_lock; use insert_sale.
+
+    Args:
+        analytics_collection: Collection holding the materialized results
+        sold_product (dict): Inserted sold_products document
+    """
+    try:
+        if analytics_collection.estimated_document_count() == 0:
+            return
+        revenue = sold_product.get("selling_price_value")
+        cost = sold_product.get("purchase_price")
+        priced = revenue is not None and cost is not None
+        turnover_days = None
+        if sold_product.get("sold_at") and sold_product.get("delivered_at"):
+            turnover_days = (sold_product["sold_at"] - sold_product["delivered_at"]).total_seconds() * 1000 / MS_PER_DAY
+        analytics_collection.update_one(
+            {"_id": sold_product["product_title"]},
+            {"$inc": {
+                "sold_count": 1,
+                "revenue": revenue or 0,
+                "cost": cost if priced else 0,
+                "margin": revenue - cost if priced else 0,
+                "priced_count": 1 if priced else 0,
+                "turnover_days_total": turnover_days or 0,
+                "turnover_count": 1 if turnover_days is not None else 0
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error updating resale analytics: {e}")
+
+def get_profit_summary(analytics_collection, sold_products_collection, order_collection, refresh=False):
+    """
+    Return resale profit totals and per-product breakdown.
+
+    Args:
+        analytics_collection: Collection holding the materialized results
+        sold_products_collection: MongoDB sold_products collection
+        order_collection: MongoDB orders collection
+        refresh (bool): Rebuild the materialized results first
+
+    Returns:
+        dict: Totals and per-product rows sorted by margin
+    """
+    if refresh or analytics_collection.estimated_document_count() == 0:
+        rebuild_resale_analytics(sold_products_collection, order_collection, analytics_collection)
+
+    totals = dict.fromkeys(TOTAL_FIELDS, 0)
+    products = []
+    for row in analytics_collection.find().sort("margin", DESCENDING):
+        for field in TOTAL_FIELDS:
+            totals[field] += row.get(field, 0)
+        products.append(summarize_row({"product_title": row["_id"], **row}))
+    return {"summary": summarize_row(totals), "products": products}
+
+def summarize_row(row):
+    """
+    Add derived averages to a totals row.
+
+    Args:
+        row (dict): Totals with cost, margin and turnover sums
+
+    Returns:
+        dict: Row with margin_percentage and avg_turnover_days
+    """
+    row.pop("_id", None)
+    cost = row.get("cost", 0)
+    turnover_count = row.get("turnover_count", 0)
+    row["margin_percentage"] = round(row.get("margin", 0) / cost * 100, 2) if cost else None
+    row["avg_turnover_days"] = round(row.get("turnover_days_total", 0) / turnover_count, 1) if turnover_count else None
+    return row
+
+def get_unsold_inventory(order_collection, sold_products_collection):
+    """
+    List delivered orders that have not been sold yet.
+
+    Args:
+        order_collection: MongoDB orders collection
+        sold_products_collection: MongoDB sold_products collection
+
+    Returns:
+        dict: Unsold items with purchase price and capital tied up
+    """
+    pipeline = [
+        {"$lookup": {
+            "from": sold_products_collection.name,
+            "localField": "order_id",
+            "foreignField": "order_id",
+            "as": "sales"
+        }},
+        {"$match": {"sales": {"$size": 0}}},
+        {"$project": {
+            "_id": 0,
+            "order_id": 1,
+            "product_title": 1,
+            "delivery_date": 1,
+            "current_status": 1,
+            "purchase_price": 1
+        }},
+    ]
+    items = list(order_collection.aggregate(pipeline))
+    return {
+        "count": len(items),
+        "capital_tied_up": sum(item["purchase_price"] for item in items if isinstance(item.get("purchase_price"), (int, float))),
+        "items": items
+    }
@@ -2,6 +2,7 @@ from flask import Flask
 import logging
 import os
 from routes import routes, MongoJSONEncoder  # Import Blueprint and custom JSON Encoder
+from events import start_webhook_dispatcher
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +21,9 @@ def create_app():
     # Register the Blueprint
     app.register_blueprint(routes)
 
+    # Deliver outbox events to WEBHOOK_URLS in the background
+    start_webhook_dispatcher()
+
     return app
 
 app = create_app()
@@ -0,0 +1,74 @@
+"""
+Microbenchmark for the department classifier.
+
+Compares the compiled Aho-Corasick rules against a linear substring scan
+over a large synthetic rule set.
+
+Usage:
+    python benchmark_classifier.py [rule_count] [query_count]
+"""
+import sys
+import time
+import random
+import string
+from classifier import compile_rules
+
+def make_rules(count, seed=0):
+    """Generate synthetic brand/model keyword rules."""
+    rng = random.Random(seed)
+    departments = ["electronics", "computers", "appliances", "fashion", "books"]
+    keywords = set()
+    while len(keywords) < count:
+        keywords.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))))
+    return [
+        {"keyword": keyword, "department": rng.choice(departments), "priority": rng.randint(0, 5)}
+        for keyword in sorted(keywords)
+    ]
+
+def make_queries(rules, count, seed=1):
+    """Generate queries, roughly half containing a known keyword."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8))) for _ in range(4)]
+        if rng.random() < 0.5:
+            words.insert(rng.randint(0, len(words)), rng.choice(rules)["keyword"])
+        queries.append(' '.join(words))
+    return queries
+
+def linear_classify(rules, query):
+    """Baseline: the original dict-scan approach."""
+    query_lower = query.lower()
+    for rule in rules:
+        if rule["keyword"] in query_lower:
+            return rule["department"]
+    return 'all'
+
+def main():
+    rule_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    rules = make_rules(rule_count)
+    queries = make_queries(rules, query_count)
+
+    start = time.perf_counter()
+    compiled = compile_rules(rules)
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        compiled.classify(query)
+    automaton_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in queries:
+        linear_classify(rules, query)
+    linear_time = time.perf_counter() - start
+
+    print(f"rules={rule_count} queries={query_count}")
+    print(f"compile:        {compile_time * 1000:.1f} ms")
+    print(f"aho-corasick:   {automaton_time / query_count * 1e6:.1f} us/query")
+    print(f"linear scan:    {linear_time / query_count * 1e6:.1f} us/query")
+
+if __name__ == '__main__':
+    main()
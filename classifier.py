@@ -0,0 +1,274 @@
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Used whenever the rules collections are empty or unreachable.
+# Priorities keep the original lookup order when several keywords match.
+DEFAULT_DEPARTMENT_RULES = [
+    {"keyword": "iphone", "department": "electronics", "priority": 5},
+    {"keyword": "samsung", "department": "electronics", "priority": 4},
+    {"keyword": "macbook", "department": "computers", "priority": 3},
+    {"keyword": "laptop", "department": "computers", "priority": 2},
+    {"keyword": "ipad", "department": "electronics", "priority": 1},
+]
+
+DEFAULT_PRICE_BANDS = [
+    {"department": "electronics", "min_price": 5000},
+    {"department": "computers", "min_price": 20000},
+]
+
+RULES_REFRESH_INTERVAL = 30  # seconds between change checks
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton for matching many keywords in a single pass.
+
+    Keywords are added with an arbitrary payload; after build() the text is
+    scanned once and every keyword occurrence is reported, regardless of how
+    many keywords were loaded.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._built = False
+
+    def add(self, keyword, payload):
+        """
+        Add a keyword to the automaton.
+
+        Args:
+            keyword (str): Keyword to match
+            payload: Value reported with every match of the keyword
+        """
+        if self._built:
+            raise RuntimeError("Cannot add keywords after the automaton is built")
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(keyword), payload))
+
+    def build(self):
+        """Compute failure links breadth-first."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text):
+        """
+        Yield every keyword occurrence in text.
+
+        Args:
+            text (str): Text to scan
+
+        Yields:
+            tuple: (start index, keyword length, payload)
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, payload in output[state]:
+                yield index - length + 1, length, payload
+
+
+def _optional_float(value):
+    return None if value is None else float(value)
+
+
+class CompiledRules:
+    """
+    Immutable, pre-compiled department rules and price bands.
+
+    When several keywords match a query the winner is chosen by, in order:
+    highest priority, earliest position in the query, longest keyword, and
+    finally rule order. The result is therefore independent of scan order.
+    """
+
+    def __init__(self, rules, price_bands):
+        self.automaton = KeywordAutomaton()
+        self.rule_count = 0
+        for order, rule in enumerate(rules):
+            keyword = str(rule.get("keyword", "")).strip().lower()
+            department = rule.get("department")
+            if not keyword or not department:
+                logger.warning(f"Skipping department rule without keyword or department: {rule}")
+                continue
+            try:
+                priority = int(rule.get("priority") or 0)
+            except (TypeError, ValueError):
+                logger.warning(f"Skipping department rule with invalid priority: {rule}")
+                continue
+            # Earlier rules win remaining ties
+            self.automaton.add(keyword, (priority, -order, department))
+            self.rule_count += 1
+        self.automaton.build()
+
+        self.price_bands = {}
+        for band in price_bands:
+            department = band.get("department")
+            if not department:
+                logger.warning(f"Skipping price band without department: {band}")
+                continue
+            try:
+                self.price_bands[department] = (
+                    _optional_float(band.get("min_price")),
+                    _optional_float(band.get("max_price")),
+                )
+            except (TypeError, ValueError):
+                logger.warning(f"Skipping price band with invalid bounds: {band}")
+
+    def classify(self, query):
+        """
+        Map a search query to a department identifier.
+
+        Args:
+            query (str): Product search query
+
+        Returns:
+            str: Department identifier, 'all' if no keyword matches
+        """
+        best_key = None
+        best_department = "all"
+        for start, length, (priority, order, department) in self.automaton.iter_matches(query.lower()):
+            key = (priority, -start, length, order)
+            if best_key is None or key > best_key:
+                best_key = key
+                best_department = department
+        return best_department
+
+    def is_valid_price(self, price, department):
+        """
+        Check a price against the department's price band.
+
+        Args:
+            price (float): Product price
+            department (str): Product department
+
+        Returns:
+            bool: Price validity status
+        """
+        min_price, max_price = self.price_bands.get(department, (None, None))
+        if min_price is not None and price < min_price:
+            return False
+        if max_price is not None and price > max_price:
+            return False
+        return True
+
+
+def compile_rules(rules=None, price_bands=None):
+    """
+    Compile rule documents, falling back to the built-in defaults.
+
+    Args:
+        rules (list): Keyword rule documents
+        price_bands (list): Price band documents
+
+    Returns:
+        CompiledRules: Compiled rule set
+    """
+    return CompiledRules(
+        rules or DEFAULT_DEPARTMENT_RULES,
+        price_bands or DEFAULT_PRICE_BANDS,
+    )
+
+
+class DepartmentClassifier:
+    """
+    Department classifier backed by rules stored in MongoDB.
+
+    Rules are compiled once and swapped atomically. At most every
+    refresh_interval seconds a cheap signature (document count, latest _id
+    and latest 'updated_at') is read from both collections; the rules are
+    only recompiled when it changes. Writers should set 'updated_at' when editing
+    a rule in place so the change is picked up.
+
+    Rule documents: {"keyword": str, "department": str, "priority": int}
+    Price band documents: {"department": str, "min_price": float, "max_price": float}
+    """
+
+    def __init__(self, rules_collection, bands_collection, refresh_interval=RULES_REFRESH_INTERVAL):
+        self.rules_collection = rules_collection
+        self.bands_collection = bands_collection
+        self.refresh_interval = refresh_interval
+        self._compiled = compile_rules()
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _collection_signature(self, collection):
+        if collection is None:
+            return None
+        result = list(collection.aggregate([
+            {"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "last_id": {"$max": "$_id"},
+                "updated": {"$max": "$updated_at"}
+            }}
+        ]))
+        return (result[0]["count"], result[0]["last_id"], result[0]["updated"]) if result else (0, None, None)
+
+    def reload(self, force=False):
+        """
+        Recompile the rules if the stored rules have changed.
+
+        Args:
+            force (bool): Recompile even if the signature is unchanged
+        """
+        with self._lock:
+            # Another thread may have refreshed while this one waited for the lock
+            if not force and time.monotonic() - self._checked_at < self.refresh_interval:
+                return
+            self._checked_at = time.monotonic()
+            try:
+                signature = (
+                    self._collection_signature(self.rules_collection),
+                    self._collection_signature(self.bands_collection),
+                )
+                if not force and signature == self._signature:
+                    return
+                # Sorting by _id keeps rule order (the last tie-breaker) stable
+                rules = list(self.rules_collection.find().sort("_id", 1)) if self.rules_collection is not None else []
+                bands = list(self.bands_collection.find()) if self.bands_collection is not None else []
+                compiled = compile_rules(rules, bands)
+            except Exception as e:
+                logger.error(f"Error reloading department rules, keeping previous rules: {e}")
+                return
+            self._compiled = compiled
+            self._signature = signature
+            logger.info(f"Compiled {compiled.rule_count} department rules and {len(compiled.price_bands)} price bands")
+
+    def _current(self):
+        if time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.reload()
+        return self._compiled
+
+    def classify(self, query):
+        return self._current().classify(query)
+
+    def is_valid_price(self, price, department):
+        return self._current().is_valid_price(price, department)
@@ -24,19 +24,33 @@ def get_database_connection():
         return None
 
 def get_collections(db):
-    """Get product, order, and sold_products collections from the database."""
+    """Get product, order, sold_products, classifier rule, analytics, event outbox and collection version collections from the database."""
     if db is not None:
         product_collection = db["products"]
         order_collection = db["orders"]
         sold_products_collection = db["sold_products"]  # नया Collection
-        return product_collection, order_collection, sold_products_collection
-    return None, None, None
+        department_rules_collection = db["department_rules"]
+        price_bands_collection = db["price_bands"]
+        resale_analytics_collection = db["resale_analytics"]
+        event_outbox_collection = db["event_outbox"]
+        collection_versions_collection = db["collection_versions"]
+        return (product_collection, order_collection, sold_products_collection,
+                department_rules_collection, price_bands_collection, resale_analytics_collection,
+                event_outbox_collection, collection_versions_collection)
+    return None, None, None, None, None, None, None, None
 
 # Initialize database connection and collections
 database = get_database_connection()
 product_collection = None
 order_collection = None
 sold_products_collection = None  # नया Collection
+department_rules_collection = None
+price_bands_collection = None
+resale_analytics_collection = None
+event_outbox_collection = None
+collection_versions_collection = None
 
 if database is not None:
-    product_collection, order_collection, sold_products_collection = get_collections(database)
\ No newline at end of file
+    (product_collection, order_collection, sold_products_collection,
+     department_rules_collection, price_bands_collection, resale_analytics_collection,
+     event_outbox_collection, collection_versions_collection) = get_collections(database)
\ No newline at end of file
@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+import requests
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure
+from database import event_outbox_collection
+
+logger = logging.getLogger(__name__)
+
+# Comma separated list of URLs receiving batched event POSTs
+WEBHOOK_URLS = [url.strip() for url in os.getenv("WEBHOOK_URLS", "").split(",") if url.strip()]
+
+WEBHOOK_BATCH_SIZE = 50
+WEBHOOK_POLL_INTERVAL = 5  # seconds between outbox scans
+WEBHOOK_TIMEOUT = 10  # seconds per POST
+WEBHOOK_MAX_ATTEMPTS = 8
+WEBHOOK_LEASE_SECONDS = 60
+OUTBOX_RETENTION_DAYS = 7
+SSE_WAIT_SECONDS = 2  # polling interval when change streams are unavailable
+SSE_QUEUE_SIZE = 100  # undelivered events buffered per SSE client
+SSE_HEARTBEAT_SECONDS = 15
+# ObjectIds are generated before the insert, so a lower id can become
+# visible after a higher one. Reads re-scan this window and drop ids
+# already sent instead of trusting "_id greater than the last one seen".
+SSE_OVERLAP_SECONDS = 10
+
+class EventBus:
+    """
+    Publishes events to a persisted MongoDB outbox.
+
+    The outbox is the single source for both delivery paths: SSE streams
+    receive it through one shared tailer thread per process, and the
+    webhook dispatcher marks entries delivered. The tailer follows a
+    change stream when MongoDB runs as a replica set; on a standalone
+    server it polls the outbox once per SSE_WAIT_SECONDS for all clients,
+    and local publishes wake it immediately.
+
+    Each SSE client holds its request thread open, so /events/stream needs
+    a threaded or async worker (see gunicorn.conf.py).
+    """
+
+    def __init__(self, outbox_collection):
+        self.outbox_collection = outbox_collection
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._tailer = None
+
+    def ensure_indexes(self):
+        """Create the outbox indexes, including the retention TTL."""
+        try:
+            self.outbox_collection.create_index(
+                [("created_at", ASCENDING)],
+                expireAfterSeconds=OUTBOX_RETENTION_DAYS * 24 * 3600
+            )
+            self.outbox_collection.create_index([("webhook_status", ASCENDING), ("next_attempt_at", ASCENDING)])
+        except Exception as e:
+            logger.error(f"Error creating event outbox indexes: {e}")
+
+    def publish(self, event_type, data):
+        """
+        Persist an event and wake the local tailer.
+
+        Args:
+            event_type (str): Event name, e.g. "price_drop"
+            data (dict): JSON-serializable event payload
+        """
+        if self.outbox_collection is None:
+            return
+        event = {
+            "type": event_type,
+            "data": data,
+            "created_at": datetime.utcnow(),
+            "webhook_status": "pending" if WEBHOOK_URLS else "skipped",
+            "delivered_to": [],
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow()
+        }
+        try:
+            self.outbox_collection.insert_one(event)
+        except Exception as e:
+            logger.error(f"Error publishing {event_type} event: {e}")
+            return
+        self._wakeup.set()
+
+    def _subscribe(self):
+        subscriber = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+        subscriber.overflowed = False
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._tailer is None:
+                self._tailer = threading.Thread(target=self._tail, daemon=True, name="event-outbox-tailer")
+                self._tailer.start()
+        self._wakeup.set()
+        return subscriber
+
+    def _unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _fan_out(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client is dropped; it resumes from Last-Event-ID on reconnect
+                subscriber.overflowed = True
+                self._unsubscribe(subscriber)
+
+    def _tail(self):
+        while True:
+            try:
+                self._watch_changes()
+            except OperationFailure as e:
+                logger.info(f"Change streams unavailable ({e}), polling the event outbox instead")
+                try:
+                    self._poll_outbox()
+                except Exception as e:
+                    logger.error(f"Event outbox tailer error: {e}")
+            except Exception as e:
+                logger.error(f"Event outbox tailer error: {e}")
+            time.sleep(SSE_WAIT_SECONDS)
+
+    def _watch_changes(self):
+        with self.outbox_collection.watch([{"$match": {"operationType": "insert"}}]) as changes:
+            for change in changes:
+                self._fan_out(change["fullDocument"])
+
+    def _poll_outbox(self):
+        fanned_out = set()
+        while True:
+            self._wakeup.wait(SSE_WAIT_SECONDS)
+            self._wakeup.clear()
+            with self._lock:
+                idle = not self._subscribers
+            if idle:
+                # Nobody is listening; new streams replay from their own Last-Event-ID
+                fanned_out.clear()
+                continue
+            since = _overlap_start(datetime.utcnow())
+            for event in self.outbox_collection.find({"_id": {"$gt": since}}).sort("_id", ASCENDING):
+                if event["_id"] not in fanned_out:
+                    fanned_out.add(event["_id"])
+                    self._fan_out(event)
+            _forget_before(fanned_out, since)
+
+    @staticmethod
+    def _format(event):
+        payload = json.dumps({**event["data"], "created_at": event["created_at"].isoformat()}, default=str)
+        return f"id: {event['_id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+    def stream(self, last_event_id=None, event_types=None):
+        """
+        Yield Server-Sent Events, replaying from last_event_id first.
+
+        The replay re-reads SSE_OVERLAP_SECONDS before last_event_id so
+        late-inserted events aren't skipped. Events from that window may be
+        sent again after a reconnect; clients deduplicate by event id.
+
+        Args:
+            last_event_id (str): Resume after this event id
+            event_types (list): Only stream these event types
+
+        Yields:
+            str: SSE-formatted messages
+        """
+        subscriber = self._subscribe()
+        try:
+            try:
+                last_id = ObjectId(last_event_id) if last_event_id else None
+            except Exception:
+                last_id = None
+
+            sent = set()
+            if last_id is not None:
+                sent.add(last_id)
+                query = {"_id": {"$gt": _overlap_start(last_id.generation_time)}}
+                if event_types:
+                    query["type"] = {"$in": event_types}
+                for event in self.outbox_collection.find(query).sort("_id", ASCENDING):
+                    if event["_id"] not in sent:
+                        sent.add(event["_id"])
+                        yield self._format(event)
+
+            while not subscriber.overflowed:
+                try:
+                    event = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Comment line keeps proxies open and surfaces disconnected clients
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["_id"] in sent or (event_types and event["type"] not in event_types):
+                    continue
+                sent.add(event["_id"])
+                _forget_before(sent, _overlap_start(datetime.utcnow()))
+                yield self._format(event)
+        finally:
+            self._unsubscribe(subscriber)
+
+def _overlap_start(moment):
+    """Lowest ObjectId that can still be unseen when reading at moment."""
+    return ObjectId.from_datetime(moment - timedelta(seconds=SSE_OVERLAP_SECONDS))
+
+def _forget_before(seen_ids, cutoff):
+    """Drop ids that have fallen out of the overlap window."""
+    seen_ids.difference_update([event_id for event_id in seen_ids if event_id <= cutoff])
+
+class WebhookDispatcher(threading.Thread):
+    """
+    Background thread delivering outbox events to WEBHOOK_URLS.
+
+    Pending events are leased in batches so several workers can run a
+    dispatcher without double-sending. Each URL receives a JSON list of
+    events; failures are retried with exponential backoff until
+    WEBHOOK_MAX_ATTEMPTS is reached.
+    """
+
+    def __init__(self, outbox_collection, urls):
+        super().__init__(daemon=True, name="webhook-dispatcher")
+        self.outbox_collection = outbox_collection
+        self.urls = urls
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                while self.dispatch_batch():
+                    pass
+            except Exception as e:
+                logger.error(f"Webhook dispatch error: {e}")
+            self._stop_event.wait(WEBHOOK_POLL_INTERVAL)
+
+    def _lease_batch(self):
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        candidates = self.outbox_collection.find(
+            {
+                "webhook_status": "pending",
+                "next_attempt_at": {"$lte": now},
+                "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}]
+            },
+            {"_id": 1}
+        ).sort("_id", ASCENDING).limit(WEBHOOK_BATCH_SIZE)
+        ids = [event["_id"] for event in candidates]
+        if not ids:
+            return []
+        # Re-check the lease in the update so a concurrent worker can't claim the same events
+        self.outbox_collection.update_many(
+            {"_id": {"$in": ids}, "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"lease_token": token, "lease_until": now + timedelta(seconds=WEBHOOK_LEASE_SECONDS)}}
+        )
+        return list(self.outbox_collection.find({"lease_token": token}).sort("_id", ASCENDING))
+
+    def dispatch_batch(self):
+        """
+        Deliver one leased batch of events.
+
+        Returns:
+            bool: True if a batch was processed
+        """
+        events = self._lease_batch()
+        if not events:
+            return False
+
+        for url in self.urls:
+            pending = [event for event in events if url not in event["delivered_to"]]
+            if not pending:
+                continue
+            body = [{
+                "id": str(event["_id"]),
+                "type": event["type"],
+                "data": event["data"],
+                "created_at": event["created_at"].isoformat()
+            } for event in pending]
+            try:
+                response = requests.post(url, json=body, timeout=WEBHOOK_TIMEOUT)
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning(f"Webhook delivery to {url} failed for {len(pending)} events: {e}")
+                continue
+            for event in pending:
+                event["delivered_to"].append(url)
+
+        for event in events:
+            update = {"$set": {"delivered_to": event["delivered_to"]}, "$unset": {"lease_token": "", "lease_until": ""}}
+            if all(url in event["delivered_to"] for url in self.urls):
+                update["$set"]["webhook_status"] = "delivered"
+            else:
+                attempts = event["attempts"] + 1
+                update["$set"]["attempts"] = attempts
+                if attempts >= WEBHOOK_MAX_ATTEMPTS:
+                    update["$set"]["webhook_status"] = "failed"
+                else:
+                    backoff = min(WEBHOOK_POLL_INTERVAL * 2 ** attempts, 3600)
+                    update["$set"]["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=backoff)
+            self.outbox_collection.update_one({"_id": event["_id"]}, update)
+        return True
+
+event_bus = EventBus(event_outbox_collection)
+
+def publish_event(event_type, data):
+    """
+    Publish an event on the shared bus.
+
+    Args:
+        event_type (str): Event name
+        data (dict): JSON-serializable event payload
+    """
+    event_bus.publish(event_type, data)
+
+def start_webhook_dispatcher():
+    """
+    Start the webhook dispatcher if WEBHOOK_URLS is configured.
+
+    Returns:
+        WebhookDispatcher or None: Running dispatcher
+    """
+    if not WEBHOOK_URLS or event_outbox_collection is None:
+        return None
+    dispatcher = WebhookDispatcher(event_outbox_collection, WEBHOOK_URLS)
+    dispatcher.start()
+    logger.info(f"Webhook dispatcher started for {len(WEBHOOK_URLS)} URL(s)")
+    return dispatcher
@@ -0,0 +1,11 @@
+import os
+
+# Long-lived requests (/events/stream) each hold a thread, so use threaded
+# workers; sync workers would be blocked and killed by the request timeout.
+worker_class = "gthread"
+
+# The fetch scheduler's per-host budget and priority queues are in-process.
+# A single worker makes every request thread share them; scale with threads.
+workers = 1
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+bind = f"0.0.0.0:{os.getenv('PORT', 10000)}"
@@ -0,0 +1,164 @@
+import gzip
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from flask import Response, current_app, jsonify, request
+from database import collection_versions_collection
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_RESPONSES = 256
+MIN_COMPRESS_SIZE = 1024  # bytes; smaller bodies are sent uncompressed
+
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=6)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+
+class _CachedResponse:
+    __slots__ = ("version", "body", "encoded")
+
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        self.encoded = {}
+
+class ResponseCache:
+    """
+    Serialized-response cache driven by per-collection versions.
+
+    Every write to a collection bumps its version document in MongoDB, so
+    all workers agree on when a read endpoint's payload changed. Responses
+    carry a strong ETag derived from that version; a matching If-None-Match
+    on a GET or HEAD is answered with 304 without touching the data.
+    Otherwise the serialized body (and its gzip/brotli encodings) is reused
+    until the version moves.
+
+    Each version document holds a random epoch so resetting the counter
+    can never revive an ETag a client still holds.
+    """
+
+    def __init__(self, versions_collection, max_entries=MAX_CACHED_RESPONSES):
+        self.versions_collection = versions_collection
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bump(self, name):
+        """
+        Mark a collection as changed.
+
+        Args:
+            name (str): Collection name
+        """
+        if self.versions_collection is None:
+            return
+        try:
+            self.versions_collection.update_one(
+                {"_id": name},
+                {"$inc": {"version": 1}, "$setOnInsert": {"epoch": uuid.uuid4().hex}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error bumping version of {name}: {e}")
+
+    def version(self, name):
+        """
+        Return the current version of a collection.
+
+        Args:
+            name (str): Collection name
+
+        Returns:
+            str: Opaque version identifier
+        """
+        doc = self.versions_collection.find_one({"_id": name})
+        if doc is None:
+            self.versions_collection.update_one(
+                {"_id": name},
+                {"$setOnInsert": {"epoch": uuid.uuid4().hex, "version": 0}},
+                upsert=True
+            )
+            doc = self.versions_collection.find_one({"_id": name})
+        return f"{doc['epoch']}.{doc['version']}"
+
+    def respond(self, name, key, build):
+        """
+        Serve a cached JSON response for a read endpoint.
+
+        Args:
+            name (str): Collection the payload is derived from
+            key (str): Distinguishes payloads of the same collection, e.g. the query
+            build (callable): Returns (payload, status) when the cache is stale
+
+        Returns:
+            Response: 200, 304, or the uncached non-200 response from build
+        """
+        if self.versions_collection is None:
+            payload, status = build()
+            return jsonify(payload), status
+
+        version = self.version(name)
+        encoding = request.accept_encodings.best_match(list(COMPRESSORS) + ["identity"], default="identity")
+        base_etag = hashlib.sha1(f"{name}:{key}:{version}".encode()).hexdigest()
+
+        # The client may hold the ETag of any encoding; all of them are still current.
+        # If-None-Match uses weak comparison, so W/ tags (e.g. from nginx) match too.
+        known_etags = [base_etag] + [f"{base_etag}-{enc}" for enc in COMPRESSORS]
+        matched = next((tag for tag in known_etags if request.if_none_match.contains_weak(tag)), None)
+        if matched is not None and request.method in ("GET", "HEAD"):
+            response = Response(status=304)
+            response.set_etag(matched)
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+
+        cache_key = (name, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+        if entry is None or entry.version != version:
+            payload, status = build()
+            if status != 200:
+                return jsonify(payload), status
+            entry = _CachedResponse(version, current_app.json.dumps(payload).encode())
+            with self._lock:
+                self._entries[cache_key] = entry
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        if encoding == "identity" or len(entry.body) < MIN_COMPRESS_SIZE:
+            body, etag = entry.body, base_etag
+            encoding = "identity"
+        else:
+            body = entry.encoded.get(encoding)
+            if body is None:
+                body = entry.encoded[encoding] = COMPRESSORS[encoding](entry.body)
+            etag = f"{base_etag}-{encoding}"
+
+        response = Response(body, status=200, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = "no-cache"
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+response_cache = ResponseCache(collection_versions_collection)
+
+def bump_collection_version(collection):
+    """
+    Bump the version of a collection after a write.
+
+    Args:
+        collection: MongoDB collection that was written to
+    """
+    if collection is not None:
+        response_cache.bump(collection.name)
@@ -1,14 +1,23 @@
-from flask import Blueprint, jsonify, request
+import math
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 from bson import ObjectId
 import logging
 from json import JSONEncoder
 from functools import wraps
 from amazon_scrap import (
-    get_department_id, get_soup, find_lowest_price_item,
+    get_department_id, get_soup, find_lowest_price_item, record_purchase_price,
     update_stock_status, login_amazon_and_continue, create_driver,
     navigate_to_orders_and_get_details
 )
-from database import product_collection, order_collection, sold_products_collection
+from database import product_collection, order_collection, sold_products_collection, resale_analytics_collection
+from analytics import (
+    ensure_indexes, to_float, parse_sold_date, parse_delivery_date,
+    insert_sale, get_profit_summary, get_unsold_inventory
+)
+from search import ensure_text_indexes, search_collections, SEARCH_SCOPES
+from events import event_bus
+from scheduler import fetch_scheduler, fetch_context, CancelToken, FetchCancelled, client_disconnected
+from response_cache import response_cache, bump_collection_version
 
 # Custom JSONEncoder to handle ObjectId
 class MongoJSONEncoder(JSONEncoder):
@@ -22,6 +31,11 @@ routes = Blueprint('routes', __name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+if product_collection is not None:
+    ensure_indexes(product_collection, order_collection, sold_products_collection)
+    ensure_text_indexes(product_collection, sold_products_collection)
+    event_bus.ensure_indexes()
+
 def handle_exceptions(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -32,6 +46,20 @@ def handle_exceptions(f):
             return jsonify({"error": str(e)}), 500
     return wrapper
 
+def interactive_fetch(f):
+    """Run the view's Amazon fetches at interactive priority, cancelled if the client disconnects."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        environ = request.environ
+        token = CancelToken(lambda: client_disconnected(environ))
+        try:
+            with fetch_context("interactive", token):
+                return f(*args, **kwargs)
+        except FetchCancelled as e:
+            logger.info(f"{f.__name__} cancelled: {e}")
+            return jsonify({"error": "Request cancelled"}), 499
+    return wrapper
+
 def convert_objectid(doc):
     """Recursively convert ObjectId to string in dicts or lists."""
     if isinstance(doc, dict):
@@ -53,6 +81,7 @@ def home():
 
 @routes.route('/order_details', methods=['GET'])
 @handle_exceptions
+@interactive_fetch
 def get_order_details():
     driver = create_driver(headless=True)
     order_details = navigate_to_orders_and_get_details(driver)
@@ -63,6 +92,7 @@ def get_order_details():
 
 @routes.route('/scrape_amazon', methods=['POST'])
 @handle_exceptions
+@interactive_fetch
 def scrape_amazon_endpoint():
     data = request.get_json()
     if not data or 'query' not in data:
@@ -71,7 +101,11 @@ def scrape_amazon_endpoint():
     query, driver = data['query'], create_driver(headless=True)
     department = get_department_id(query)
     search_url = f"https://www.amazon.in/s?k={query}&i={department if department != 'all' else ''}"
-    search_soup = get_soup(search_url, driver)
+    try:
+        search_soup = get_soup(search_url, driver)
+    finally:
+        # Released before the slow steps so a cancelled or failed request doesn't leak Chrome
+        driver.quit()
     
     items = search_soup.find_all("div", class_="s-result-item") if search_soup else []
     lowest_price_item = find_lowest_price_item(items, department)
@@ -81,6 +115,8 @@ def scrape_amazon_endpoint():
     
     update_stock_status(lowest_price_item)
     payment_success = login_amazon_and_continue(lowest_price_item['link'])
+    if payment_success is True:
+        record_purchase_price(lowest_price_item)
     lowest_price_item['price_history'] = [
         entry for i, entry in enumerate(lowest_price_item.get('price_history', []))
         if i == 0 or entry['price'] != lowest_price_item['price_history'][i-1]['price']
@@ -94,40 +130,53 @@ def scrape_amazon_endpoint():
             "details": price_drop
         }
     
-    driver.quit()
     return jsonify(response_data), 200 if payment_success else 500
 
 @routes.route('/get_products', methods=['GET'])
 @handle_exceptions
 def get_products():
-    return jsonify({"products": convert_objectid(list(product_collection.find()))}), 200
+    return response_cache.respond(
+        product_collection.name, "all",
+        lambda: ({"products": convert_objectid(list(product_collection.find()))}, 200)
+    )
 
 @routes.route('/get_orders', methods=['GET'])
 @handle_exceptions
 def get_orders():
-    return jsonify({"orders": convert_objectid(list(order_collection.find()))}), 200
+    return response_cache.respond(
+        order_collection.name, "all",
+        lambda: ({"orders": convert_objectid(list(order_collection.find()))}, 200)
+    )
 
 @routes.route('/delete_product/<product_id>', methods=['DELETE'])
 @handle_exceptions
 def delete_product(product_id):
     result = product_collection.delete_one({"_id": validate_objectid(product_id)})
+    if result.deleted_count:
+        bump_collection_version(product_collection)
     return jsonify({"message": "Product deleted successfully"}) if result.deleted_count else jsonify({"error": "Product not found"}), 404
 
 @routes.route('/delete_order/<order_id>', methods=['DELETE'])
 @handle_exceptions
 def delete_order(order_id):
     result = order_collection.delete_one({"_id": validate_objectid(order_id)})
+    if result.deleted_count:
+        bump_collection_version(order_collection)
     return jsonify({"message": "Order deleted successfully"}) if result.deleted_count else jsonify({"error": "Order not found"}), 404
 
 @routes.route('/delete_all_products', methods=['DELETE'])
 @handle_exceptions
 def delete_all_products():
-    return jsonify({"message": f"Deleted {product_collection.delete_many({}).deleted_count} products successfully"}), 200
+    deleted_count = product_collection.delete_many({}).deleted_count
+    bump_collection_version(product_collection)
+    return jsonify({"message": f"Deleted {deleted_count} products successfully"}), 200
 
 @routes.route('/delete_all_orders', methods=['DELETE'])
 @handle_exceptions
 def delete_all_orders():
-    return jsonify({"message": f"Deleted {order_collection.delete_many({}).deleted_count} orders successfully"}), 200
+    deleted_count = order_collection.delete_many({}).deleted_count
+    bump_collection_version(order_collection)
+    return jsonify({"message": f"Deleted {deleted_count} orders successfully"}), 200
 
 @routes.route('/sell_product', methods=['POST'])
 @handle_exceptions
@@ -144,35 +193,140 @@ def sell_product():
     if not order:
         return jsonify({"error": "Order not found"}), 404
     
+    selling_price_value = to_float(data["selling_price"])
+    if selling_price_value is None:
+        return jsonify({"error": f"Invalid selling_price: {data['selling_price']}"}), 400
+    
+    # Orders saved before purchase prices were recorded can have it supplied with the sale
+    purchase_price = order.get("purchase_price")
+    if purchase_price is None and "purchase_price" in data:
+        purchase_price = to_float(data["purchase_price"])
+        if purchase_price is None:
+            return jsonify({"error": f"Invalid purchase_price: {data['purchase_price']}"}), 400
+    
+    # Snapshot purchase price and parsed dates so analytics don't depend on later edits
+    sold_at = parse_sold_date(data.get("sold_date"))
+    
     sold_product = {
         "order_id": order["order_id"],
         "product_title": order["product_title"],
         "delivery_date": order["delivery_date"],
         "current_status": "Sold",
         "selling_price": data["selling_price"],
+        "selling_price_value": selling_price_value,
         "buyer_name": data["buyer_name"],
         "buyer_contact": data["buyer_contact"],
-        "sold_date": data.get("sold_date", "Not specified")
+        "sold_date": data.get("sold_date", "Not specified"),
+        "purchase_price": purchase_price,
+        "sold_at": sold_at,
+        "delivered_at": parse_delivery_date(order["delivery_date"], sold_at)
     }
     
-    sold_products_collection.insert_one(sold_product)
+    insert_sale(sold_products_collection, resale_analytics_collection, sold_product)
+    bump_collection_version(sold_products_collection)
     return jsonify({"message": "Product sold successfully", "sold_product": convert_objectid(sold_product)}), 201
 
+def sold_product_query(params):
+    """Build the sold_products filter from order_id or buyer_name, or None if both are missing."""
+    if 'order_id' in params:
+        return {'order_id': validate_objectid(params['order_id'])}
+    if 'buyer_name' in params:
+        return {'buyer_name': params['buyer_name']}
+    return None
+
+def find_sold_product(query):
+    sold_product = sold_products_collection.find_one(query)
+    if not sold_product:
+        return {"error": "Sold product not found"}, 404
+    return {"message": "Sold product details retrieved successfully", "sold_product": convert_objectid(sold_product)}, 200
+
 @routes.route('/get_sold_product', methods=['POST'])
 @handle_exceptions
 def get_sold_product():
-    data = request.get_json()
-    if not data or ('order_id' not in data and 'buyer_name' not in data):
+    query = sold_product_query(request.get_json() or {})
+    if query is None:
         return jsonify({"error": "Missing required fields: order_id or buyer_name"}), 400
 
-    query = {}
-    if 'order_id' in data:
-        query['order_id'] = validate_objectid(data['order_id'])
-    elif 'buyer_name' in data:
-        query['buyer_name'] = data['buyer_name']
+    payload, status = find_sold_product(query)
+    return jsonify(payload), status
 
-    sold_product = sold_products_collection.find_one(query)
-    if not sold_product:
-        return jsonify({"error": "Sold product not found"}), 404
+# Cacheable variant: conditional requests (ETag/304) only apply to GET
+@routes.route('/get_sold_product', methods=['GET'])
+@handle_exceptions
+def get_sold_product_by_query():
+    query = sold_product_query(request.args)
+    if query is None:
+        return jsonify({"error": "Missing required parameters: order_id or buyer_name"}), 400
+
+    return response_cache.respond(
+        sold_products_collection.name, repr(sorted(query.items())),
+        lambda: find_sold_product(query)
+    )
+
+@routes.route('/analytics/profit', methods=['GET'])
+@handle_exceptions
+def get_profit_analytics():
+    refresh = request.args.get('refresh', 'false').lower() == 'true'
+    profit = get_profit_summary(
+        resale_analytics_collection, sold_products_collection,
+        order_collection, refresh=refresh
+    )
+    return jsonify(convert_objectid(profit)), 200
+
+@routes.route('/analytics/inventory', methods=['GET'])
+@handle_exceptions
+def get_inventory_analytics():
+    inventory = get_unsold_inventory(order_collection, sold_products_collection)
+    return jsonify(convert_objectid(inventory)), 200
+
+@routes.route('/search', methods=['GET'])
+@handle_exceptions
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing required 'q' parameter"}), 400
+
+    scope = request.args.get('scope', 'all')
+    if scope != 'all' and scope not in SEARCH_SCOPES:
+        return jsonify({"error": f"Invalid scope, expected one of: all, {', '.join(SEARCH_SCOPES)}"}), 400
+
+    try:
+        min_price = float(request.args['min_price']) if 'min_price' in request.args else None
+        max_price = float(request.args['max_price']) if 'max_price' in request.args else None
+        if any(price is not None and not math.isfinite(price) for price in (min_price, max_price)):
+            raise ValueError("non-finite price")
+    except ValueError:
+        return jsonify({"error": "min_price and max_price must be finite numbers"}), 400
+    if min_price is not None and max_price is not None and min_price > max_price:
+        return jsonify({"error": "min_price must not be greater than max_price"}), 400
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 20))
+    except ValueError:
+        return jsonify({"error": "page and per_page must be integers"}), 400
+
+    collections = {"products": product_collection, "sold_products": sold_products_collection}
+    if scope != 'all':
+        collections = {scope: collections[scope]}
+
+    results = search_collections(collections, query, min_price, max_price, page, per_page)
+    return jsonify(convert_objectid(results)), 200
+
+# Each open stream occupies a worker thread; requires the gthread worker from gunicorn.conf.py
+@routes.route('/events/stream', methods=['GET'])
+def stream_events():
+    if event_bus.outbox_collection is None:
+        return jsonify({"error": "Event outbox unavailable"}), 503
+
+    # Browsers resend Last-Event-ID on reconnect; 'since' allows the same for other clients
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    event_types = [t for t in request.args.get('types', '').split(',') if t] or None
+    return Response(
+        stream_with_context(event_bus.stream(last_event_id, event_types)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    return jsonify({"message": "Sold product details retrieved successfully", "sold_product": convert_objectid(sold_product)}), 200
+@routes.route('/scheduler/stats', methods=['GET'])
+def get_scheduler_stats():
+    return jsonify({"priorities": fetch_scheduler.stats()}), 200
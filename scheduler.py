@@ -0,0 +1,275 @@
+import os
+import time
+import socket
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Relative share of fetch slots each priority class gets while both are queued
+PRIORITY_WEIGHTS = {
+    "interactive": 4,
+    "background": 1,
+}
+DEFAULT_PRIORITY = "background"
+
+FETCH_HOST_CONCURRENCY = int(os.getenv("FETCH_HOST_CONCURRENCY", 2))
+FETCH_HOST_MIN_INTERVAL = float(os.getenv("FETCH_HOST_MIN_INTERVAL", 1.0))  # seconds between fetch starts
+FETCH_CANCEL_POLL = 0.5  # seconds between cancellation checks while queued
+
+class FetchCancelled(Exception):
+    """Raised when a queued fetch is cancelled before it starts."""
+
+class CancelToken:
+    """
+    Cancellation flag for queued fetches.
+
+    Args:
+        check (callable): Optional predicate polled while waiting, e.g. a
+            client-disconnect check
+    """
+
+    def __init__(self, check=None):
+        self._cancelled = threading.Event()
+        self._check = check
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        if not self._cancelled.is_set() and self._check is not None and self._check():
+            self._cancelled.set()
+        return self._cancelled.is_set()
+
+def client_disconnected(environ):
+    """
+    Check whether the client behind a WSGI request has closed its socket.
+
+    Works with gunicorn and the Werkzeug development server over plain TCP;
+    TLS sockets and other servers are treated as always connected.
+
+    Args:
+        environ (dict): WSGI environ
+
+    Returns:
+        bool: True if the peer has disconnected
+    """
+    sock = environ.get("gunicorn.socket") or environ.get("werkzeug.socket")
+    # SSLSocket.recv rejects flags, and peeking would read encrypted bytes anyway
+    if type(sock) is not socket.socket:
+        return False
+    try:
+        # A readable socket with no data means the peer sent FIN
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except (BlockingIOError, InterruptedError, ValueError):
+        return False
+    except OSError:
+        return True
+
+class _Ticket:
+    __slots__ = ("priority", "cancel_token", "enqueued_at")
+
+    def __init__(self, priority, cancel_token):
+        self.priority = priority
+        self.cancel_token = cancel_token
+        self.enqueued_at = time.monotonic()
+
+class _HostState:
+    """Queues and budget bookkeeping for one host."""
+
+    def __init__(self):
+        self.queues = {priority: deque() for priority in PRIORITY_WEIGHTS}
+        # Stride scheduling: the non-empty class with the lowest pass goes next
+        self.passes = dict.fromkeys(PRIORITY_WEIGHTS, 0.0)
+        self.in_flight = 0
+        self.next_start = 0.0
+
+    def enqueue(self, ticket):
+        queue = self.queues[ticket.priority]
+        if not queue:
+            # A class returning from idle must not bank credit from its idle time
+            active = [self.passes[p] for p, q in self.queues.items() if q]
+            if active:
+                self.passes[ticket.priority] = max(self.passes[ticket.priority], min(active))
+        queue.append(ticket)
+
+    def head(self):
+        candidates = [p for p, q in self.queues.items() if q]
+        if not candidates:
+            return None
+        priority = min(candidates, key=lambda p: (self.passes[p], -PRIORITY_WEIGHTS[p]))
+        return self.queues[priority][0]
+
+    def grant(self, ticket, now, min_interval):
+        self.queues[ticket.priority].popleft()
+        self.passes[ticket.priority] += 1.0 / PRIORITY_WEIGHTS[ticket.priority]
+        self.in_flight += 1
+        self.next_start = now + min_interval
+
+class FetchScheduler:
+    """
+    Central gate for every request made to a remote host.
+
+    Each host has a concurrency limit and a minimum interval between fetch
+    starts. Waiting fetches are queued per priority class and served by
+    weighted fair queuing, so interactive requests overtake background work
+    without starving it. Queued fetches whose cancel token fires are
+    dropped before they consume any budget.
+
+    The state lives in this process, so every scrape path must run in the
+    same process for the budget to be shared: gunicorn.conf.py runs a
+    single gthread worker whose threads all queue here.
+    """
+
+    def __init__(self, host_concurrency=FETCH_HOST_CONCURRENCY, host_min_interval=FETCH_HOST_MIN_INTERVAL):
+        self.host_concurrency = host_concurrency
+        self.host_min_interval = host_min_interval
+        self._hosts = {}
+        self._condition = threading.Condition()
+        self._stats = {priority: {"queued": 0, "in_flight": 0, "completed": 0, "cancelled": 0,
+                                  "total_wait": 0.0, "max_wait": 0.0}
+                       for priority in PRIORITY_WEIGHTS}
+
+    @contextmanager
+    def slot(self, url, priority=None, cancel_token=None):
+        """
+        Wait for a fetch slot on the URL's host and hold it for the block.
+
+        Args:
+            url (str): URL about to be fetched
+            priority (str): Priority class, defaults to the current fetch context
+            cancel_token (CancelToken): Defaults to the current fetch context
+
+        Raises:
+            FetchCancelled: If the token fires while the fetch is queued
+        """
+        context_priority, context_token = current_fetch_context()
+        priority = priority or context_priority
+        if priority not in PRIORITY_WEIGHTS:
+            raise ValueError(f"Unknown fetch priority: {priority}")
+        ticket = _Ticket(priority, cancel_token or context_token)
+        host = urlparse(url).netloc or url
+        self._acquire(host, ticket)
+        try:
+            yield
+        finally:
+            self._release(host, ticket)
+
+    def _acquire(self, host, ticket):
+        stats = self._stats[ticket.priority]
+        with self._condition:
+            state = self._hosts.setdefault(host, _HostState())
+            state.enqueue(ticket)
+            stats["queued"] += 1
+            try:
+                while True:
+                    if ticket.cancel_token is not None and ticket.cancel_token.cancelled:
+                        stats["cancelled"] += 1
+                        raise FetchCancelled(f"Fetch to {host} cancelled while queued")
+
+                    now = time.monotonic()
+                    if state.head() is ticket and state.in_flight < self.host_concurrency and now >= state.next_start:
+                        state.grant(ticket, now, self.host_min_interval)
+                        wait = now - ticket.enqueued_at
+                        stats["queued"] -= 1
+                        stats["in_flight"] += 1
+                        stats["total_wait"] += wait
+                        stats["max_wait"] = max(stats["max_wait"], wait)
+                        # Another slot may be free for the next ticket once the interval passes
+                        self._condition.notify_all()
+                        return
+
+                    timeout = FETCH_CANCEL_POLL
+                    if state.next_start > now:
+                        timeout = min(timeout, state.next_start - now)
+                    self._condition.wait(timeout)
+            except BaseException:
+                # Never leave a dead ticket at the head of the queue, whatever
+                # raised (cancellation, a failing cancel check, KeyboardInterrupt)
+                state.queues[ticket.priority].remove(ticket)
+                stats["queued"] -= 1
+                self._condition.notify_all()
+                raise
+
+    def _release(self, host, ticket):
+        with self._condition:
+            self._hosts[host].in_flight -= 1
+            stats = self._stats[ticket.priority]
+            stats["in_flight"] -= 1
+            stats["completed"] += 1
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Report queue depth and wait time per priority class.
+
+        Returns:
+            dict: Per-class counters and average/max wait in seconds
+        """
+        with self._condition:
+            report = {}
+            for priority, stats in self._stats.items():
+                started = stats["in_flight"] + stats["completed"]
+                report[priority] = {
+                    "queue_depth": stats["queued"],
+                    "in_flight": stats["in_flight"],
+                    "completed": stats["completed"],
+                    "cancelled": stats["cancelled"],
+                    "avg_wait_seconds": round(stats["total_wait"] / started, 3) if started else 0.0,
+                    "max_wait_seconds": round(stats["max_wait"], 3),
+                }
+            return report
+
+fetch_scheduler = FetchScheduler()
+_context = threading.local()
+
+def current_fetch_context():
+    """
+    Return the priority and cancel token set for the current thread.
+
+    Returns:
+        tuple: (priority, CancelToken or None)
+    """
+    return getattr(_context, "priority", DEFAULT_PRIORITY), getattr(_context, "cancel_token", None)
+
+@contextmanager
+def fetch_context(priority, cancel_token=None):
+    """
+    Set the priority and cancel token for fetches made in this thread.
+
+    Args:
+        priority (str): Priority class
+        cancel_token (CancelToken): Token cancelling queued fetches
+    """
+    previous = current_fetch_context()
+    _context.priority, _context.cancel_token = priority, cancel_token
+    try:
+        yield
+    finally:
+        _context.priority, _context.cancel_token = previous
+
+def raise_if_cancelled():
+    """
+    Stop work for a request whose cancel token has fired.
+
+    Raises:
+        FetchCancelled: If the current fetch context is cancelled
+    """
+    _, cancel_token = current_fetch_context()
+    if cancel_token is not None and cancel_token.cancelled:
+        raise FetchCancelled("Request cancelled")
+
+def scheduled_get(driver, url):
+    """
+    Load a URL in a WebDriver through the fetch scheduler.
+
+    Args:
+        driver (webdriver.Chrome): Selenium WebDriver
+        url (str): URL to load
+    """
+    with fetch_scheduler.slot(url):
+        driver.get(url)
@@ -0,0 +1,124 @@
+import logging
+from pymongo import TEXT
+from analytics import SELLING_PRICE_EXPR
+
+logger = logging.getLogger(__name__)
+
+MAX_PER_PAGE = 100
+
+# Text-indexed fields and the price used for range filters, per search scope
+SEARCH_SCOPES = {
+    "products": {
+        "fields": ["title"],
+        "price": "$numerical_price",
+    },
+    "sold_products": {
+        "fields": ["product_title", "buyer_name"],
+        "price": SELLING_PRICE_EXPR,
+    },
+}
+
+def ensure_text_indexes(product_collection, sold_products_collection):
+    """
+    Create the text indexes backing the search endpoint.
+
+    MongoDB maintains them on every write, so products saved by save_to_db
+    and records inserted by /sell_product are searchable immediately.
+
+    Args:
+        product_collection: MongoDB products collection
+        sold_products_collection: MongoDB sold_products collection
+    """
+    collections = {"products": product_collection, "sold_products": sold_products_collection}
+    for scope, collection in collections.items():
+        try:
+            collection.create_index(
+                [(field, TEXT) for field in SEARCH_SCOPES[scope]["fields"]],
+                name=f"{scope}_search"
+            )
+        except Exception as e:
+            logger.error(f"Error creating text index on {scope}: {e}")
+
+def search_pipeline(scope, query, min_price=None, max_price=None, skip=0, limit=20):
+    """
+    Build a ranked, paginated text search pipeline.
+
+    Args:
+        scope (str): Key of SEARCH_SCOPES
+        query (str): Search terms
+        min_price (float): Lower price bound
+        max_price (float): Upper price bound
+        skip (int): Number of results to skip
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Aggregation stages producing {"total": [...], "items": [...]}
+    """
+    pipeline = [
+        {"$match": {"$text": {"$search": query}}},
+        {"$addFields": {
+            "score": {"$meta": "textScore"},
+            "search_price": SEARCH_SCOPES[scope]["price"],
+            "source": scope
+        }},
+    ]
+    price_filter = {}
+    if min_price is not None:
+        price_filter["$gte"] = min_price
+    if max_price is not None:
+        price_filter["$lte"] = max_price
+    if price_filter:
+        pipeline.append({"$match": {"search_price": price_filter}})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "items": [{"$skip": skip}, {"$limit": limit}],
+        }},
+    ]
+    return pipeline
+
+def search_collections(collections, query, min_price=None, max_price=None, page=1, per_page=20):
+    """
+    Search one or more collections and merge results by relevance.
+
+    Args:
+        collections (dict): Scope name to MongoDB collection
+        query (str): Search terms
+        min_price (float): Lower price bound
+        max_price (float): Upper price bound
+        page (int): 1-based page number
+        per_page (int): Results per page
+
+    Returns:
+        dict: Total match count, page info and ranked results
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    skip = (page - 1) * per_page
+
+    # With several scopes each one must return everything up to the end of
+    # the requested page; the merged list is then sliced.
+    merged = len(collections) > 1
+    total = 0
+    results = []
+    for scope, collection in collections.items():
+        facet = next(collection.aggregate(search_pipeline(
+            scope, query, min_price, max_price,
+            skip=0 if merged else skip,
+            limit=skip + per_page if merged else per_page
+        )))
+        total += facet["total"][0]["count"] if facet["total"] else 0
+        results += facet["items"]
+
+    if merged:
+        results.sort(key=lambda item: item["score"], reverse=True)
+        results = results[skip:skip + per_page]
+
+    return {
+        "query": query,
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "results": results
+    }